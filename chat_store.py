@@ -1,16 +1,60 @@
 """SQLite helper for storing YouTube live chat messages."""
 from __future__ import annotations
 
-import json
 import os
+import queue
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+import orjson
+
 DEFAULT_LIMIT = 50
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 1.0
+
+# Stored in PRAGMA user_version once the table, index and colors_json column exist.
+_SCHEMA_VERSION = 2
 
-_db: Optional[sqlite3.Connection] = None
 _db_path: Optional[str] = None
+# Read-only connection for get_recent_comments; all writes go through the writer thread.
+_reader: Optional[sqlite3.Connection] = None
+_writer: Optional[threading.Thread] = None
+# Items are row batches, threading.Event flush barriers, or _STOP.
+_write_q: queue.Queue[Any] = queue.Queue()
+_STOP = object()
+
+_buffer: List[tuple] = []
+_buffer_lock = threading.Lock()
+_last_flush = 0.0
+
+# Recently saved ids; YouTube re-sends actions across polls, so repeats are dropped before SQLite.
+_seen: OrderedDict[str, None] = OrderedDict()
+_SEEN_MAX = 4096
+
+_CACHE_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+)
+_PRAGMAS = ("PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", *_CACHE_PRAGMAS)
+
+# Column order of _INSERT_SQL, minus the two JSON columns appended after them.
+_INSERT_KEYS = (
+    "id",
+    "video_id",
+    "timestamp_ms",
+    "timestamp",
+    "author",
+    "text",
+    "kind",
+    "amount",
+    "amount_text",
+    "icon",
+)
 
 _INSERT_SQL = """
 INSERT OR IGNORE INTO comments
@@ -18,6 +62,16 @@ INSERT OR IGNORE INTO comments
   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 """
 
+# Keys of the dicts returned by get_recent_comments, in _SELECT_RECENT_SQL column order.
+_RESULT_COLS = (*_INSERT_KEYS, "parts", "colors")
+
+_SELECT_RECENT_SQL = """
+  SELECT id, video_id, timestamp_ms, timestamp, author, text, kind, amount, amount_text, icon, parts_json, colors_json
+  FROM comments
+  ORDER BY timestamp_ms DESC, rowid DESC
+  LIMIT ?
+"""
+
 
 def _ensure_colors_column(conn: sqlite3.Connection) -> None:
     """Add colors_json if it does not exist (backward compatibility)."""
@@ -25,19 +79,14 @@ def _ensure_colors_column(conn: sqlite3.Connection) -> None:
     columns = [row[1] for row in cur.fetchall()]
     if "colors_json" in columns:
         return
-    conn.execute("ALTER TABLE comments ADD COLUMN colors_json TEXT")
-    conn.commit()
+    conn.execute("ALTER TABLE comments ADD COLUMN colors_json BLOB")
 
 
-def init_chat_store(base_dir: Optional[str] = None) -> str:
-    """Initialize the SQLite database under base_dir (defaults to CWD)."""
-    global _db, _db_path
-    directory = Path(base_dir or os.getcwd())
-    directory.mkdir(parents=True, exist_ok=True)
-
-    _db_path = str(directory / "comments.db")
-    _db = sqlite3.connect(_db_path, check_same_thread=False)
-    _db.execute(
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    """Create or upgrade the comments table unless user_version is already current."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= _SCHEMA_VERSION:
+        return
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS comments (
           id TEXT PRIMARY KEY,
@@ -50,100 +99,226 @@ def init_chat_store(base_dir: Optional[str] = None) -> str:
           amount INTEGER,
           amount_text TEXT,
           icon TEXT,
-          parts_json TEXT,
-          colors_json TEXT
+          parts_json BLOB,
+          colors_json BLOB
         )
         """
     )
-    _ensure_colors_column(_db)
-    _db.commit()
+    # rowid is the implicit tail of every index, so this also covers the rowid tie-break.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_ts ON comments(timestamp_ms)")
+    _ensure_colors_column(conn)
+    conn.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+
+
+def _write_loop(path: str, ready: threading.Event, startup_errors: List[Exception]) -> None:
+    """Own the write connection: set up the schema, then apply queued batches until _STOP."""
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        conn = sqlite3.connect(path, isolation_level=None, cached_statements=128)
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        _ensure_schema(conn)
+    except sqlite3.Error as exc:
+        if conn is not None:
+            conn.close()
+        startup_errors.append(exc)
+        ready.set()
+        return
+    ready.set()
+
+    try:
+        while True:
+            try:
+                item = _write_q.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                # Write rows save_comment left in the buffer once FLUSH_INTERVAL passes idle.
+                with _buffer_lock:
+                    item = _drain_buffer_locked()
+                if not item:
+                    continue
+            if item is _STOP:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            try:
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany(_INSERT_SQL, item)
+            except sqlite3.DatabaseError as exc:
+                print(f"save_comments sqlite error: {exc}")
+            except Exception as exc:  # pylint: disable=broad-except
+                # e.g. OverflowError/InterfaceError binding a bad value; keep the writer alive.
+                print(f"save_comments error: {exc!a}")
+    finally:
+        conn.close()
+
+
+def init_chat_store(base_dir: Optional[str] = None) -> str:
+    """Initialize the SQLite database under base_dir (defaults to CWD)."""
+    global _db_path, _reader, _writer
+    close_chat_store()
+    with _buffer_lock:
+        _seen.clear()
+    directory = Path(base_dir or os.getcwd())
+    directory.mkdir(parents=True, exist_ok=True)
+
+    db_file = (directory / "comments.db").resolve()
+    ready = threading.Event()
+    startup_errors: List[Exception] = []
+    writer = threading.Thread(
+        target=_write_loop, args=(str(db_file), ready, startup_errors), daemon=True
+    )
+    writer.start()
+    ready.wait()
+    if startup_errors:
+        raise startup_errors[0]
+
+    # get_recent_comments may be called from any thread (GUI, fetcher), hence check_same_thread=False.
+    reader: Optional[sqlite3.Connection] = None
+    try:
+        reader = sqlite3.connect(
+            f"{db_file.as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=128,
+        )
+        for pragma in _CACHE_PRAGMAS:
+            reader.execute(pragma)
+    except Exception:
+        if reader is not None:
+            reader.close()
+        _write_q.put(_STOP)
+        writer.join()
+        raise
+
+    _db_path = str(db_file)
+    _reader = reader
+    _writer = writer
     return _db_path
 
 
+def _to_row(msg: Dict[str, Any]) -> tuple:
+    return (
+        *map(msg.get, _INSERT_KEYS),
+        orjson.dumps(msg.get("parts") or []),
+        orjson.dumps(msg.get("colors")),
+    )
+
+
+def _drain_buffer_locked() -> List[tuple]:
+    """Take all buffered rows. Caller must hold _buffer_lock."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    rows = list(_buffer)
+    _buffer.clear()
+    return rows
+
+
+def _flush_locked() -> None:
+    """Hand buffered rows to the writer thread as one batch. Caller must hold _buffer_lock."""
+    if _writer is None or not _buffer:
+        return
+    _write_q.put(_drain_buffer_locked())
+
+
+def flush() -> None:
+    """Write any buffered messages to the database and wait until they are committed."""
+    done = threading.Event()
+    with _buffer_lock:
+        _flush_locked()
+        writer = _writer
+        if writer is None:
+            return
+        _write_q.put(done)
+    # Don't wait forever if the writer thread is gone.
+    while not done.wait(FLUSH_INTERVAL):
+        if not writer.is_alive():
+            return
+
+
+def _mark_seen_locked(msgs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return msgs whose id was not saved recently and remember them. Caller must hold _buffer_lock."""
+    new = [msg for msg in msgs if msg and "id" in msg and msg["id"] not in _seen]
+    for msg in new:
+        _seen[msg["id"]] = None
+    while len(_seen) > _SEEN_MAX:
+        _seen.popitem(last=False)
+    return new
+
+
 def save_comment(msg: Dict[str, Any]) -> None:
-    """Persist a single chat message."""
-    if _db is None or not msg or "id" not in msg:
+    """Buffer a single chat message; written once BATCH_SIZE rows or FLUSH_INTERVAL seconds accumulate."""
+    if _writer is None or not msg or "id" not in msg:
         return
 
-    parts_json = json.dumps(msg.get("parts") or [])
-    colors_json = json.dumps(msg.get("colors")) if "colors" in msg else json.dumps(None)
+    with _buffer_lock:
+        if not _mark_seen_locked([msg]):
+            return
+        _buffer.append(_to_row(msg))
+        if len(_buffer) >= BATCH_SIZE or time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+            _flush_locked()
+
+
+def save_comments(msgs: List[Dict[str, Any]]) -> None:
+    """Persist a batch of chat messages in a single transaction."""
+    if _writer is None:
+        return
 
+    with _buffer_lock:
+        _buffer.extend(map(_to_row, _mark_seen_locked(msgs)))
+        _flush_locked()
+
+
+def _row_to_dict(row: tuple) -> Dict[str, Any]:
+    d = dict(zip(_RESULT_COLS, row))
     try:
-        _db.execute(
-            _INSERT_SQL,
-            (
-                msg.get("id"),
-                msg.get("video_id"),
-                msg.get("timestamp_ms"),
-                msg.get("timestamp"),
-                msg.get("author"),
-                msg.get("text"),
-                msg.get("kind"),
-                msg.get("amount"),
-                msg.get("amount_text"),
-                msg.get("icon"),
-                parts_json,
-                colors_json,
-            ),
-        )
-        _db.commit()
-    except sqlite3.DatabaseError as exc:
-        print(f"save_comment sqlite error: {exc}")
+        d["parts"] = orjson.loads(d["parts"]) if d["parts"] else []
+    except orjson.JSONDecodeError:
+        d["parts"] = []
+    try:
+        d["colors"] = orjson.loads(d["colors"]) if d["colors"] else None
+    except orjson.JSONDecodeError:
+        d["colors"] = None
+    return d
 
 
 def get_recent_comments(limit: int = DEFAULT_LIMIT) -> List[Dict[str, Any]]:
     """Fetch most recent comments (oldest first in the returned list)."""
-    if _db is None:
+    if _reader is None:
         return []
     lim = limit if 1 <= limit <= 500 else DEFAULT_LIMIT
-    sql = """
-      SELECT id, video_id, timestamp_ms, timestamp, author, text, kind, amount, amount_text, icon, parts_json, colors_json
-      FROM comments
-      ORDER BY timestamp_ms DESC, rowid DESC
-      LIMIT ?
-    """
     try:
-        cur = _db.execute(sql, (lim,))
+        cur = _reader.execute(_SELECT_RECENT_SQL, (lim,))
         rows = cur.fetchall()
     except sqlite3.DatabaseError as exc:
         print(f"get_recent_comments sqlite error: {exc}")
         return []
 
-    result: List[Dict[str, Any]] = []
-    for row in reversed(rows):
-        try:
-            parts = json.loads(row[10]) if row[10] else []
-        except json.JSONDecodeError:
-            parts = []
-        try:
-            colors = json.loads(row[11]) if row[11] else None
-        except json.JSONDecodeError:
-            colors = None
-        result.append(
-            {
-                "id": row[0],
-                "video_id": row[1],
-                "timestamp_ms": row[2],
-                "timestamp": row[3],
-                "author": row[4],
-                "text": row[5],
-                "kind": row[6],
-                "amount": row[7],
-                "amount_text": row[8],
-                "icon": row[9],
-                "parts": parts,
-                "colors": colors,
-            }
-        )
+    # Rows arrive newest first; fill a pre-sized list from the back to return oldest first.
+    last = len(rows) - 1
+    result: List[Dict[str, Any]] = [None] * len(rows)  # type: ignore[list-item]
+    for i, row in enumerate(rows):
+        result[last - i] = _row_to_dict(row)
     return result
 
 
 def close_chat_store() -> None:
-    """Close the database."""
-    global _db
-    if _db is not None:
-        _db.close()
-    _db = None
+    """Write pending messages, stop the writer thread and close the database."""
+    global _reader, _writer
+    with _buffer_lock:
+        _flush_locked()
+        writer = _writer
+        _writer = None
+        if writer is not None:
+            _write_q.put(_STOP)
+    # Join outside the lock: the writer takes _buffer_lock for its interval flush.
+    if writer is not None:
+        writer.join()
+    if _reader is not None:
+        _reader.close()
+    _reader = None
 
 
 def get_db_path() -> Optional[str]:
@@ -153,6 +328,8 @@ def get_db_path() -> Optional[str]:
 __all__ = [
     "init_chat_store",
     "save_comment",
+    "save_comments",
+    "flush",
     "get_recent_comments",
     "close_chat_store",
     "get_db_path",
@@ -2,7 +2,8 @@
 from __future__ import annotations
 
 import argparse
-import json
+
+import orjson
 
 import chat_store
 
@@ -31,7 +32,7 @@ def main() -> None:
     rows = chat_store.get_recent_comments(args.limit)
 
     if args.json:
-        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        print(orjson.dumps(rows, option=orjson.OPT_INDENT_2).decode())
         return
 
     for r in rows:
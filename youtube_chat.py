@@ -1,14 +1,19 @@
 """YouTube live chat scraper (Python version of youtubeChat.js)."""
 from __future__ import annotations
 
-import json
+import queue
 import re
 import threading
 import time
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import ijson
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import chat_store
 
@@ -16,11 +21,55 @@ USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120 Safari/537.36
 
 session = requests.Session()
 session.headers.update({"User-Agent": USER_AGENT})
+_retry = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods={"GET", "POST"},
+)
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_retry))
+
+_KEY_RE = re.compile(r'"INNERTUBE_API_KEY"\s*:\s*"([^"]+)"')
+_VER_RE = re.compile(r'"clientVersion"\s*:\s*"([\d\.]+)"')
+_CONT_RE = re.compile(r'"continuation"\s*:\s*"([^"]+)"')
+_CANON_RE = re.compile(r'<link rel="canonical" href="https://www\.youtube\.com/watch\?v=([^"]+)">')
+_AMOUNT_RE = re.compile(r"([\d,]+)")
+
+# live_chat responses smaller than this are parsed in one go with orjson.
+_STREAM_MIN_BYTES = 64 * 1024
+_LIVE_CONT_PREFIX = "continuationContents.liveChatContinuation"
+
+# live_chat statuses that mean the scraped apiKey/clientVersion/continuation went stale.
+_REFRESH_STATUSES = frozenset({400, 401, 403, 410})
 
 _running_lock = threading.Lock()
 _stop_event = threading.Event()
 _is_running = False
 
+# Messages are handed to a writer thread so printing and SQLite never stall the poll loop.
+_SENTINEL = object()
+_out_q: queue.Queue[Any] = queue.Queue(maxsize=2048)
+_dropped = 0
+
+
+class LiveChatHTTPError(RuntimeError):
+    """live_chat request failed with a non-success HTTP status."""
+
+    def __init__(self, status_code: int, body: str) -> None:
+        super().__init__(f"live_chat error: {status_code} {body}")
+        self.status_code = status_code
+
+
+@dataclass
+class _ApiCtx:
+    api_key: str
+    client_version: str
+    continuation: str
+
+
+# Scraped watch-page options per videoId, kept for the process lifetime.
+_api_ctx: Dict[str, _ApiCtx] = {}
+
 
 def _utc_offset_minutes() -> int:
     """Return local UTC offset in minutes."""
@@ -49,10 +98,7 @@ def resolve_video_id(input_str: str) -> Optional[str]:
         raise RuntimeError(f"failed to fetch /live page: {resp.status_code}")
 
     html = resp.text
-    m = re.search(
-        r'<link rel="canonical" href="https://www\.youtube\.com/watch\?v=([^"]+)">',
-        html,
-    )
+    m = _CANON_RE.search(html)
     return m.group(1) if m else None
 
 
@@ -65,9 +111,9 @@ def get_watch_html(video_id: str) -> str:
 
 
 def extract_options_from_html(html: str) -> Dict[str, str]:
-    key_match = re.search(r'"INNERTUBE_API_KEY"\s*:\s*"([^"]+)"', html)
-    ver_match = re.search(r'"clientVersion"\s*:\s*"([\d\.]+)"', html)
-    cont_match = re.search(r'"continuation"\s*:\s*"([^"]+)"', html)
+    key_match = _KEY_RE.search(html)
+    ver_match = _VER_RE.search(html)
+    cont_match = _CONT_RE.search(html)
     if not key_match:
         raise RuntimeError("INNERTUBE_API_KEY not found")
     if not ver_match:
@@ -89,7 +135,9 @@ def extract_continuation_data(cont0: Dict[str, Any]) -> Tuple[str, int]:
     raise RuntimeError(f"Unknown continuation block type: {list(cont0.keys())}")
 
 
-def post_live_chat(api_key: str, client_version: str, continuation: str) -> Dict[str, Any]:
+def _request_live_chat(
+    api_key: str, client_version: str, continuation: str, stream: bool = False
+) -> requests.Response:
     url = f"https://www.youtube.com/youtubei/v1/live_chat/get_live_chat?key={api_key}"
     payload = {
         "context": {
@@ -109,10 +157,40 @@ def post_live_chat(api_key: str, client_version: str, continuation: str) -> Dict
         "X-YouTube-Client-Name": "1",
         "X-YouTube-Client-Version": client_version,
     }
-    resp = session.post(url, headers=headers, data=json.dumps(payload))
+    resp = session.post(url, headers=headers, data=orjson.dumps(payload), stream=stream)
     if not resp.ok:
-        raise RuntimeError(f"live_chat error: {resp.status_code} {resp.text}")
-    return resp.json()
+        raise LiveChatHTTPError(resp.status_code, resp.text)
+    return resp
+
+
+def post_live_chat(api_key: str, client_version: str, continuation: str) -> Dict[str, Any]:
+    resp = _request_live_chat(api_key, client_version, continuation)
+    return orjson.loads(resp.content)
+
+
+def _iter_live_chat_actions(
+    resp: requests.Response, continuations: List[Dict[str, Any]]
+) -> Iterator[Dict[str, Any]]:
+    """Yield chat actions as they are parsed; continuations are appended to the given list."""
+    length = resp.headers.get("Content-Length")
+    if length is not None and int(length) < _STREAM_MIN_BYTES:
+        # Read via raw so requests does not keep a cached copy of the body alive.
+        data = orjson.loads(resp.raw.read(decode_content=True))
+        live_cont = data["continuationContents"]["liveChatContinuation"]
+        continuations.extend(live_cont["continuations"])
+        actions = live_cont.get("actions", []) or []
+        # Let the rest of the response tree be reclaimed while the action loop runs.
+        del data, live_cont
+        yield from actions
+        return
+
+    # kvitems builds each child of liveChatContinuation in C, one at a time.
+    resp.raw.decode_content = True
+    for key, value in ijson.kvitems(resp.raw, _LIVE_CONT_PREFIX, use_float=True):
+        if key == "continuations":
+            continuations.extend(value)
+        elif key == "actions":
+            yield from value or []
 
 
 def switch_to_all_chat_continuation(api_key: str, client_version: str, continuation: str) -> str:
@@ -135,7 +213,7 @@ def runs_to_plain(runs: List[Dict[str, Any]]) -> str:
 def parse_amount_to_int(text: str) -> Optional[int]:
     if not text:
         return None
-    m = re.search(r"([\d,]+)", text)
+    m = _AMOUNT_RE.search(text)
     if not m:
         return None
     digits = m.group(1).replace(",", "")
@@ -145,12 +223,16 @@ def parse_amount_to_int(text: str) -> Optional[int]:
         return None
 
 
-def parse_message_parts(renderer: Dict[str, Any]) -> List[Dict[str, Any]]:
+def parse_message_parts(renderer: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], str]:
+    """Return the message parts and the concatenated plain text of its text runs."""
     parts: List[Dict[str, Any]] = []
+    text_buf: List[str] = []
     runs = renderer.get("message", {}).get("runs", []) or []
     for r in runs:
         if "text" in r:
-            parts.append({"type": "text", "text": r.get("text", "")})
+            text = r["text"]
+            parts.append({"type": "text", "text": text})
+            text_buf.append(text)
         elif "emoji" in r:
             emoji = r["emoji"]
             thumbs = emoji.get("image", {}).get("thumbnails", []) or []
@@ -158,7 +240,7 @@ def parse_message_parts(renderer: Dict[str, Any]) -> List[Dict[str, Any]]:
             shortcuts = emoji.get("shortcuts", []) or []
             alt = shortcuts[0] if shortcuts else emoji.get("emojiId", "")
             parts.append({"type": "emoji", "url": url, "alt": alt})
-    return parts
+    return parts, "".join(text_buf)
 
 
 def parse_sticker_parts(renderer: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -187,17 +269,116 @@ def extract_author_photo(renderer: Dict[str, Any], msg_type: str) -> Optional[st
     return None
 
 
+@lru_cache(maxsize=1)
+def _format_second(sec: int) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+
+
 def format_datetime(ts_ms: int) -> str:
-    dt = datetime.fromtimestamp(ts_ms / 1000)
-    return dt.strftime("%Y-%m-%d %H:%M:%S")
+    # Bursts of messages usually share a second, so the last formatted value is cached.
+    return _format_second(ts_ms // 1000)
 
 
-def fetch_chat_once(
-    api_key: str, client_version: str, continuation: str
-) -> Tuple[List[Dict[str, Any]], str, int]:
-    data = post_live_chat(api_key, client_version, continuation)
-    live_cont = data["continuationContents"]["liveChatContinuation"]
-    actions = live_cont.get("actions", []) or []
+_RENDERER_KINDS = {
+    "liveChatTextMessageRenderer": "text",
+    "liveChatPaidMessageRenderer": "paid",
+    "liveChatPaidStickerRenderer": "sticker",
+    "liveChatMembershipItemRenderer": "membership",
+    "liveChatSponsorshipsGiftPurchaseAnnouncementRenderer": "gift_purchase",
+    "liveChatGiftRedemptionAnnouncementRenderer": "gift_redeem",
+}
+_RENDERER_KEYS = frozenset(_RENDERER_KINDS)
+
+
+def _text_fields(renderer: Dict[str, Any]) -> Dict[str, Any]:
+    parts, text_plain = parse_message_parts(renderer)
+    return {"parts": parts, "text": text_plain}
+
+
+def _paid_fields(renderer: Dict[str, Any]) -> Dict[str, Any]:
+    parts, text_plain = parse_message_parts(renderer)
+    amount_text = renderer.get("purchaseAmountText", {}).get("simpleText", "") or ""
+    return {
+        "parts": parts,
+        "text": text_plain,
+        "amount_text": amount_text,
+        "amount": parse_amount_to_int(amount_text),
+        "colors": {
+            "header_bg": to_hex(renderer.get("headerBackgroundColor")),
+            "header_text": to_hex(renderer.get("headerTextColor")),
+            "body_bg": to_hex(renderer.get("bodyBackgroundColor")),
+            "body_text": to_hex(renderer.get("bodyTextColor")),
+        },
+    }
+
+
+def _sticker_fields(renderer: Dict[str, Any]) -> Dict[str, Any]:
+    amount_text = renderer.get("purchaseAmountText", {}).get("simpleText", "") or ""
+    bg_raw = renderer.get("backgroundColor")
+    text_raw = renderer.get("moneyChipTextColor") or renderer.get("authorNameTextColor")
+    return {
+        "parts": parse_sticker_parts(renderer),
+        "text": "[STICKER]",
+        "amount_text": amount_text,
+        "amount": parse_amount_to_int(amount_text),
+        "colors": {"body_bg": to_hex(bg_raw), "body_text": to_hex(text_raw)},
+    }
+
+
+def _membership_fields(renderer: Dict[str, Any]) -> Dict[str, Any]:
+    parts, body_text = parse_message_parts(renderer)
+    header_primary = runs_to_plain(renderer.get("headerPrimaryText", {}).get("runs", []))
+    header_sub = runs_to_plain(renderer.get("headerSubtext", {}).get("runs", []))
+    text_plain = " ".join(filter(None, [header_primary, header_sub, body_text])) or "[MEMBERSHIP]"
+    return {"parts": parts, "text": text_plain}
+
+
+def _gift_purchase_fields(renderer: Dict[str, Any]) -> Dict[str, Any]:
+    header = renderer.get("header", {}).get("liveChatSponsorshipsHeaderRenderer", {}) or {}
+    header_author = header.get("authorName", {}) or {}
+    raw_author = header_author.get("simpleText") or runs_to_plain(header_author.get("runs", []))
+    display_name = raw_author.lstrip("@") if raw_author else ""
+    message = f"{display_name} sent gift memberships" if display_name else "A viewer sent gift memberships"
+    return {"parts": [{"type": "text", "text": message}], "text": message, "author": display_name}
+
+
+def _gift_redeem_fields(renderer: Dict[str, Any]) -> Dict[str, Any]:
+    header_text = runs_to_plain(renderer.get("header", {}).get("runs", []))
+    subtext = runs_to_plain(renderer.get("subtext", {}).get("runs", []))
+    text_plain = " ".join(filter(None, [header_text, subtext])) or "[GIFT REDEEM]"
+    message_runs = renderer.get("message", {}).get("runs", [])
+    if message_runs:
+        parts, _ = parse_message_parts({"message": {"runs": message_runs}})
+    else:
+        parts = [{"type": "text", "text": text_plain}]
+    return {"parts": parts, "text": text_plain}
+
+
+_MSG_HANDLERS = {
+    "text": _text_fields,
+    "paid": _paid_fields,
+    "sticker": _sticker_fields,
+    "membership": _membership_fields,
+    "gift_purchase": _gift_purchase_fields,
+    "gift_redeem": _gift_redeem_fields,
+}
+
+
+def _load_api_ctx(video_id: str, refresh: bool = False) -> _ApiCtx:
+    """Return cached API options for video_id, scraping the watch page when missing or refreshing."""
+    ctx = _api_ctx.get(video_id)
+    if ctx is not None and not refresh:
+        return ctx
+    opts = extract_options_from_html(get_watch_html(video_id))
+    api_key = opts["apiKey"]
+    client_version = opts["clientVersion"]
+    continuation = switch_to_all_chat_continuation(api_key, client_version, opts["continuation"])
+    ctx = _ApiCtx(api_key, client_version, continuation)
+    _api_ctx[video_id] = ctx
+    return ctx
+
+
+def _parse_chat_actions(actions: Iterator[Dict[str, Any]]) -> List[Dict[str, Any]]:
     chat_items: List[Dict[str, Any]] = []
 
     for idx, action in enumerate(actions):
@@ -205,32 +386,13 @@ def fetch_chat_once(
         if not item:
             continue
 
-        renderer: Optional[Dict[str, Any]] = None
-        msg_type: Optional[str] = None
-        super_colors: Optional[Dict[str, Any]] = None
-        amount_value: Optional[int] = None
-        amount_text = ""
-
-        if "liveChatTextMessageRenderer" in item:
-            renderer = item["liveChatTextMessageRenderer"]
-            msg_type = "text"
-        elif "liveChatPaidMessageRenderer" in item:
-            renderer = item["liveChatPaidMessageRenderer"]
-            msg_type = "paid"
-        elif "liveChatPaidStickerRenderer" in item:
-            renderer = item["liveChatPaidStickerRenderer"]
-            msg_type = "sticker"
-        elif "liveChatMembershipItemRenderer" in item:
-            renderer = item["liveChatMembershipItemRenderer"]
-            msg_type = "membership"
-        elif "liveChatSponsorshipsGiftPurchaseAnnouncementRenderer" in item:
-            renderer = item["liveChatSponsorshipsGiftPurchaseAnnouncementRenderer"]
-            msg_type = "gift_purchase"
-        elif "liveChatGiftRedemptionAnnouncementRenderer" in item:
-            renderer = item["liveChatGiftRedemptionAnnouncementRenderer"]
-            msg_type = "gift_redeem"
-
-        if not renderer or not msg_type:
+        matched = _RENDERER_KEYS & item.keys()
+        if not matched:
+            continue
+        key = next(iter(matched))
+        msg_type = _RENDERER_KINDS[key]
+        renderer = item[key]
+        if not renderer:
             continue
 
         author_block = renderer.get("authorName", {}) or {}
@@ -240,60 +402,9 @@ def fetch_chat_once(
         timestamp_ms = timestamp_usec // 1000
         timestr = format_datetime(timestamp_ms)
 
-        parts: List[Dict[str, Any]] = []
-        text_plain = ""
-
-        if msg_type == "text":
-            parts = parse_message_parts(renderer)
-            text_plain = "".join(p["text"] for p in parts if p["type"] == "text")
-        elif msg_type == "paid":
-            parts = parse_message_parts(renderer)
-            text_plain = "".join(p["text"] for p in parts if p["type"] == "text")
-            amount_text = renderer.get("purchaseAmountText", {}).get("simpleText", "") or ""
-            amount_value = parse_amount_to_int(amount_text)
-            super_colors = {
-                "header_bg": to_hex(renderer.get("headerBackgroundColor")),
-                "header_text": to_hex(renderer.get("headerTextColor")),
-                "body_bg": to_hex(renderer.get("bodyBackgroundColor")),
-                "body_text": to_hex(renderer.get("bodyTextColor")),
-            }
-        elif msg_type == "sticker":
-            parts = parse_sticker_parts(renderer)
-            text_plain = "[STICKER]"
-            amount_text = renderer.get("purchaseAmountText", {}).get("simpleText", "") or ""
-            amount_value = parse_amount_to_int(amount_text)
-            bg_raw = renderer.get("backgroundColor")
-            text_raw = renderer.get("moneyChipTextColor") or renderer.get("authorNameTextColor")
-            super_colors = {"body_bg": to_hex(bg_raw), "body_text": to_hex(text_raw)}
-        elif msg_type == "membership":
-            parts = parse_message_parts(renderer)
-            header_primary = runs_to_plain(renderer.get("headerPrimaryText", {}).get("runs", []))
-            header_sub = runs_to_plain(renderer.get("headerSubtext", {}).get("runs", []))
-            body_text = "".join(p["text"] for p in parts if p["type"] == "text")
-            text_plain = " ".join(filter(None, [header_primary, header_sub, body_text])) or "[MEMBERSHIP]"
-        elif msg_type == "gift_purchase":
-            header = renderer.get("header", {}).get("liveChatSponsorshipsHeaderRenderer", {}) or {}
-            header_author = header.get("authorName", {}) or {}
-            raw_author = header_author.get("simpleText") or runs_to_plain(header_author.get("runs", []))
-            display_name = raw_author.lstrip("@") if raw_author else ""
-            author = display_name or author or "Unknown"
-            message = f"{author} sent gift memberships" if display_name else "A viewer sent gift memberships"
-            parts = [{"type": "text", "text": message}]
-            text_plain = message
-        elif msg_type == "gift_redeem":
-            header_text = runs_to_plain(renderer.get("header", {}).get("runs", []))
-            subtext = runs_to_plain(renderer.get("subtext", {}).get("runs", []))
-            text_plain = " ".join(filter(None, [header_text, subtext])) or "[GIFT REDEEM]"
-            message_runs = renderer.get("message", {}).get("runs", [])
-            if message_runs:
-                parts = parse_message_parts({"message": {"runs": message_runs}})
-            else:
-                parts = [{"type": "text", "text": text_plain}]
-            if not author:
-                author = "Unknown"
-
-        if not author:
-            author = "Unknown"
+        fields = _MSG_HANDLERS[msg_type](renderer)
+        author = fields.get("author") or author or "Unknown"
+        text_plain = fields["text"]
 
         icon_url = extract_author_photo(renderer, msg_type)
         raw_id = (
@@ -306,73 +417,136 @@ def fetch_chat_once(
         chat_items.append(
             {
                 "id": msg_id,
-                "colors": super_colors,
+                "colors": fields.get("colors"),
                 "author": author,
                 "icon": icon_url,
                 "text": text_plain,
-                "parts": parts,
+                "parts": fields["parts"],
                 "timestamp_ms": timestamp_ms,
                 "timestamp": timestr,
                 "kind": msg_type,
-                "amount": amount_value,
-                "amount_text": amount_text,
+                "amount": fields.get("amount"),
+                "amount_text": fields.get("amount_text", ""),
             }
         )
 
-    cont0 = live_cont["continuations"][0]
-    next_cont, timeout_ms = extract_continuation_data(cont0)
+    return chat_items
+
+
+def fetch_chat_once(
+    api_key: str, client_version: str, continuation: str
+) -> Tuple[List[Dict[str, Any]], str, int]:
+    resp = _request_live_chat(api_key, client_version, continuation, stream=True)
+    continuations: List[Dict[str, Any]] = []
+    with resp:
+        actions = _iter_live_chat_actions(resp, continuations)
+        chat_items = _parse_chat_actions(actions)
+
+    if not continuations:
+        raise RuntimeError("live_chat response has no continuations")
+    next_cont, timeout_ms = extract_continuation_data(continuations[0])
     return chat_items, next_cont, timeout_ms
 
 
+def _write_loop(print_console: bool) -> None:
+    """Save (and optionally print) queued messages until _SENTINEL is received."""
+    while True:
+        batch = [_out_q.get()]
+        while True:
+            try:
+                batch.append(_out_q.get_nowait())
+            except queue.Empty:
+                break
+        done = batch[-1] is _SENTINEL
+        if done:
+            batch.pop()
+        if print_console:
+            try:
+                for msg in batch:
+                    preview = (
+                        f"{msg['timestamp']} {msg['author']}: {msg['text']} "
+                        f"({msg['kind']}) {msg.get('amount_text') or ''}"
+                    ).strip()
+                    print(preview)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"live_chat print error: {exc!a}")
+        try:
+            chat_store.save_comments(batch)
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"live_chat save error: {exc!a}")
+        if done:
+            return
+
+
+def _enqueue(msg: Dict[str, Any]) -> None:
+    global _dropped
+    try:
+        _out_q.put_nowait(msg)
+    except queue.Full:
+        _dropped += 1
+
+
 def start_live_chat(
     input_str: str, store_dir: Optional[str] = None, print_console: bool = False
 ) -> None:
     """Start fetching live chat in a loop (blocking)."""
-    global _is_running
+    global _is_running, _dropped
     with _running_lock:
         if _is_running:
             print("start_live_chat: already running")
             return
         _is_running = True
         _stop_event.clear()
+        _dropped = 0
 
+    writer: Optional[threading.Thread] = None
     try:
         chat_store.init_chat_store(store_dir)
+        writer = threading.Thread(target=_write_loop, args=(print_console,), daemon=True)
+        writer.start()
         video_id = resolve_video_id(input_str)
         if not video_id:
             print("Could not resolve video id")
             return
 
         print(f"Resolved videoId = {video_id}")
-        html = get_watch_html(video_id)
-        opts = extract_options_from_html(html)
-
-        api_key = opts["apiKey"]
-        client_version = opts["clientVersion"]
-        continuation = switch_to_all_chat_continuation(api_key, client_version, opts["continuation"])
+        ctx = _load_api_ctx(video_id)
+        # Only the first refresh of a failure streak retries immediately; later ones back off.
+        refreshed = False
 
         print("Start fetching live chat (Ctrl+C to stop)")
         while not _stop_event.is_set():
             try:
-                chat_items, next_cont, timeout_ms = fetch_chat_once(api_key, client_version, continuation)
-                continuation = next_cont
+                chat_items, next_cont, timeout_ms = fetch_chat_once(
+                    ctx.api_key, ctx.client_version, ctx.continuation
+                )
+                ctx.continuation = next_cont
+                refreshed = False
                 for msg in chat_items:
                     msg["video_id"] = video_id
-                    if print_console:
-                        preview = (
-                            f"{msg['timestamp']} {msg['author']}: {msg['text']} "
-                            f"({msg['kind']}) {msg.get('amount_text') or ''}"
-                        ).strip()
-                        print(preview)
-                    chat_store.save_comment(msg)
+                    _enqueue(msg)
                 time.sleep(max(timeout_ms, 500) / 1000)
             except Exception as exc:  # pylint: disable=broad-except
                 if _stop_event.is_set():
                     break
                 print(f"live_chat fetch error: {exc}")
+                if isinstance(exc, LiveChatHTTPError) and exc.status_code in _REFRESH_STATUSES:
+                    try:
+                        ctx = _load_api_ctx(video_id, refresh=True)
+                        if not refreshed:
+                            refreshed = True
+                            continue
+                    except Exception as refresh_exc:  # pylint: disable=broad-except
+                        print(f"live_chat refresh error: {refresh_exc}")
                 time.sleep(5)
         print("Stopped live chat fetcher")
     finally:
+        if writer is not None and writer.is_alive():
+            _out_q.put(_SENTINEL)
+            writer.join()
+        if _dropped:
+            print(f"Dropped {_dropped} messages (writer queue full)")
+        chat_store.flush()
         _is_running = False
 
 